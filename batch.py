@@ -0,0 +1,140 @@
+"""
+Offline story generation through the OpenAI Batch API.
+
+For evaluation runs and bulk regeneration, where nobody is waiting on the answer, the
+Batch API costs half as much as interactive completions and does not count against the
+per-minute rate limits. Use it for those pipelines, not for the interactive `main()` loop.
+
+    python batch.py submit prompts.txt    # one story request per line -> prints batch id
+    python batch.py poll <batch_id>       # waits, then prints {custom_id: story} as JSON
+"""
+import argparse
+import io
+import json
+import time
+from typing import Dict, List, Optional
+
+from openai import OpenAI
+
+from llm_factory import get_openai_client
+
+_ENDPOINT = "/v1/chat/completions"
+_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def submit_batch(
+    requests: List[str],
+    *,
+    system_prompt_path: str = "system_prompt.txt",
+    model: str = "gpt-3.5-turbo",
+    max_tokens: int = 3000,
+    temperature: float = 0.1,
+    client: Optional[OpenAI] = None,
+) -> str:
+    """
+    Submit one story generation per request as a single Batch API job.
+
+    Each request gets the StoryTeller system prompt and no history; its position in
+    `requests` (as a string) is used as the custom_id.
+
+    Returns:
+        The batch id, to be passed to poll_batch().
+    """
+    client = client or get_openai_client()
+    try:
+        with open(system_prompt_path, "r", encoding="utf-8") as f:
+            system_prompt = f.read().strip()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"System prompt file not found: {system_prompt_path}")
+
+    lines = [
+        json.dumps(
+            {
+                "custom_id": str(i),
+                "method": "POST",
+                "url": _ENDPOINT,
+                "body": {
+                    "model": model,
+                    "max_tokens": max_tokens,
+                    "temperature": temperature,
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": request},
+                    ],
+                },
+            }
+        )
+        for i, request in enumerate(requests)
+    ]
+    payload = io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))
+
+    input_file = client.files.create(file=("stories.jsonl", payload), purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=_ENDPOINT,
+        completion_window="24h",
+    )
+    return batch.id
+
+
+def poll_batch(
+    batch_id: str,
+    *,
+    poll_interval: float = 30.0,
+    client: Optional[OpenAI] = None,
+) -> Dict[str, str]:
+    """
+    Wait for a batch to finish and return its stories.
+
+    Returns:
+        {custom_id: story} for every request that succeeded. Requests that failed
+        individually are left out.
+
+    Raises:
+        RuntimeError: If the whole batch failed, expired, or was cancelled.
+    """
+    client = client or get_openai_client()
+    batch = client.batches.retrieve(batch_id)
+    while batch.status not in _TERMINAL_STATUSES:
+        time.sleep(poll_interval)
+        batch = client.batches.retrieve(batch_id)
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch_id} ended with status '{batch.status}'")
+    if not batch.output_file_id:
+        return {}
+
+    results: Dict[str, str] = {}
+    for line in client.files.content(batch.output_file_id).text.splitlines():
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        response = record.get("response") or {}
+        if response.get("status_code") != 200:
+            continue
+        results[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate stories via the OpenAI Batch API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="Submit one request per line of a text file.")
+    submit.add_argument("requests_file")
+
+    poll = commands.add_parser("poll", help="Wait for a batch and print its stories as JSON.")
+    poll.add_argument("batch_id")
+    poll.add_argument("--interval", type=float, default=30.0)
+
+    args = parser.parse_args()
+    if args.command == "submit":
+        with open(args.requests_file, "r", encoding="utf-8") as f:
+            requests = [line.strip() for line in f if line.strip()]
+        print(submit_batch(requests))
+    else:
+        print(json.dumps(poll_batch(args.batch_id, poll_interval=args.interval), indent=2))
+
+
+if __name__ == "__main__":
+    main()
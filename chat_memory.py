@@ -0,0 +1,154 @@
+import asyncio
+from typing import List, Optional, Sequence
+
+import tiktoken
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+
+
+class SummaryBufferHistory(BaseChatMessageHistory):
+    """
+    Chat history with a bounded prompt footprint.
+
+    The last `window_turns` user requests (each with its follow-up exchanges, such as
+    revisions) are kept verbatim. Once the history grows past `max_history_tokens`,
+    everything older than that window is folded (together with any previous summary) into a
+    single summary message by one cheap LLM call, so the number of tokens re-sent on every
+    request stops growing with the conversation. If the window alone is over budget, it is
+    shrunk to fewer requests (never below the latest one).
+
+    Compaction is meant to run off the request path: schedule_compaction() starts it in the
+    background after a turn is recorded, and readers keep using the current messages until
+    the summary is swapped in.
+    """
+
+    def __init__(
+        self,
+        summarizer: ChatOpenAI,
+        *,
+        max_history_tokens: int = 1500,
+        window_turns: int = 2,
+        model: str = "gpt-3.5-turbo",
+        follow_up_messages: Sequence[str] = (),
+    ):
+        """
+        Args:
+            summarizer: Chat model used to condense older turns.
+            max_history_tokens: Token budget for summary + verbatim turns before compacting.
+            window_turns: Number of most recent user requests that are never summarized.
+            model: Model whose tokenizer is used for counting.
+            follow_up_messages: User message contents that continue the previous request
+                (e.g. a revision placeholder) rather than start a new one.
+        """
+        self.summary = ""
+        self.max_history_tokens = max_history_tokens
+        self.window_turns = window_turns
+        self._summarizer = summarizer
+        self._encoding = tiktoken.encoding_for_model(model)
+        self._recent: List[BaseMessage] = []
+        # Token counts are computed once per message (and per summary), not on every request.
+        self._recent_tokens: List[int] = []
+        self._summary_tokens = 0
+        self._follow_ups = frozenset(follow_up_messages)
+        self._compact_lock = asyncio.Lock()
+        self._compaction: Optional[asyncio.Task] = None
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Summary of older turns (if any) followed by the recent turns verbatim."""
+        if not self.summary:
+            return list(self._recent)
+        return [
+            SystemMessage(content=f"Summary of the earlier conversation:\n{self.summary}"),
+            *self._recent,
+        ]
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        self._recent.extend(messages)
+        self._recent_tokens.extend(self._count(str(message.content)) for message in messages)
+
+    def clear(self) -> None:
+        self.summary = ""
+        self._summary_tokens = 0
+        self._recent = []
+        self._recent_tokens = []
+
+    def token_count(self) -> int:
+        """Approximate prompt tokens taken by the history (summary + verbatim turns)."""
+        return self._summary_tokens + sum(self._recent_tokens)
+
+    def _count(self, text: str) -> int:
+        return len(self._encoding.encode(text))
+
+    def _window_start(self) -> int:
+        """Index of the first message kept verbatim."""
+        starts = [
+            i
+            for i, message in enumerate(self._recent)
+            if isinstance(message, HumanMessage) and message.content not in self._follow_ups
+        ]
+        if not self.window_turns or not starts:
+            return len(self._recent)
+        starts = starts[-self.window_turns:]
+        # Drop whole requests from the front while the window alone is over budget.
+        while (
+            len(starts) > 1
+            and self._summary_tokens + sum(self._recent_tokens[starts[0]:])
+            > self.max_history_tokens
+        ):
+            starts.pop(0)
+        return starts[0]
+
+    def schedule_compaction(self) -> None:
+        """Start compact() in the background if the history is over budget."""
+        if self.token_count() <= self.max_history_tokens:
+            return
+        if self._compaction is not None and not self._compaction.done():
+            return
+        try:
+            self._compaction = asyncio.get_running_loop().create_task(self.compact())
+        except RuntimeError:
+            # No event loop (synchronous caller): the next scheduled run picks it up.
+            return
+        # A failed summary is retried after the next turn; it must not surface here.
+        self._compaction.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def compact(self) -> None:
+        """Summarize turns outside the recent window if the history is over budget."""
+        async with self._compact_lock:
+            if self.token_count() <= self.max_history_tokens:
+                return
+
+            older = self._recent[:self._window_start()]
+            if not older:
+                return
+
+            transcript = "\n\n".join(
+                f"{'User' if isinstance(message, HumanMessage) else 'Storyteller'}: {message.content}"
+                for message in older
+            )
+            response = await self._summarizer.ainvoke(
+                [
+                    SystemMessage(
+                        content=(
+                            "You condense a conversation between a parent and a bedtime "
+                            "storyteller. Keep what later turns may rely on: the child's "
+                            "preferences, recurring characters and their names, settings, "
+                            "and the gist of stories already told. Be brief."
+                        )
+                    ),
+                    HumanMessage(
+                        content=(
+                            f"Existing summary:\n{self.summary or '(none)'}\n\n"
+                            f"New turns to fold in:\n{transcript}\n\n"
+                            "Return the updated summary only."
+                        )
+                    ),
+                ]
+            )
+            self.summary = str(response.content).strip()
+            self._summary_tokens = self._count(self.summary)
+            # Messages may have been appended while the summary was being written.
+            self._recent = self._recent[len(older):]
+            self._recent_tokens = self._recent_tokens[len(older):]
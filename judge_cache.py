@@ -0,0 +1,75 @@
+import hashlib
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+def content_hash(text: str) -> str:
+    """Short, stable digest of a text (story or rubric) for use in cache keys."""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class JudgeCache:
+    """
+    Persistent cache of judge results keyed by (story_hash, sys_hash).
+
+    `story_hash` identifies the draft text; `sys_hash` identifies everything else the
+    verdict depends on (rubric/system prompt, model, child age, tone, target length).
+    The user request is deliberately not part of the key: the rubric scores the story, so
+    the same draft judged for different requests or experiment runs is a hit.
+
+    Entries live in a SQLite table, with a small in-memory LRU in front so repeated
+    lookups within a run do not touch the disk.
+    """
+
+    def __init__(self, path: str = ".judge_cache.db", *, memory_size: int = 1024):
+        """
+        Args:
+            path: SQLite database file (created if missing).
+            memory_size: Number of entries kept in the in-memory LRU front.
+        """
+        self._memory: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self._memory_size = memory_size
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS judge_cache ("
+            "story_hash TEXT, sys_hash TEXT, feedback_json BLOB, "
+            "PRIMARY KEY (story_hash, sys_hash))"
+        )
+        self._conn.commit()
+
+    def get(self, story_hash: str, sys_hash: str) -> Optional[str]:
+        """Cached feedback JSON for the key, or None on a miss."""
+        key = (story_hash, sys_hash)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key]
+
+        row = self._conn.execute(
+            "SELECT feedback_json FROM judge_cache WHERE story_hash = ? AND sys_hash = ?",
+            key,
+        ).fetchone()
+        if row is None:
+            return None
+        self._remember(key, row[0])
+        return row[0]
+
+    def put(self, story_hash: str, sys_hash: str, feedback_json: str) -> None:
+        """Store feedback JSON for the key (overwriting any previous entry)."""
+        key = (story_hash, sys_hash)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO judge_cache (story_hash, sys_hash, feedback_json) "
+            "VALUES (?, ?, ?)",
+            (*key, feedback_json),
+        )
+        self._conn.commit()
+        self._remember(key, feedback_json)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def _remember(self, key: Tuple[str, str], feedback_json: str) -> None:
+        self._memory[key] = feedback_json
+        self._memory.move_to_end(key)
+        if len(self._memory) > self._memory_size:
+            self._memory.popitem(last=False)
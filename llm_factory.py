@@ -0,0 +1,78 @@
+import os
+from functools import lru_cache
+from typing import Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI
+from openai import AsyncOpenAI, OpenAI
+
+# Environment is loaded and the key read once for the whole process.
+load_dotenv()
+_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Optional: Langfuse's drop-in OpenAI client traces direct SDK calls when configured.
+_TracedAsyncOpenAI = AsyncOpenAI
+if os.getenv("LANGFUSE_PUBLIC_KEY"):
+    try:
+        from langfuse.openai import AsyncOpenAI as _TracedAsyncOpenAI
+    except ImportError:
+        pass
+
+
+@lru_cache(maxsize=None)
+def get_http_async_client() -> httpx.AsyncClient:
+    """
+    Process-wide async HTTP pool shared by every OpenAI client (storyteller, judge, summarizer).
+
+    Keeping one pool means parallel drafts, tournament comparisons and reviews reuse warm
+    keep-alive connections instead of each client paying its own TCP + TLS handshakes.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+        timeout=60,
+    )
+
+
+@lru_cache(maxsize=8)
+def get_chat(
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    base_url: Optional[str] = None,
+    prompt_cache_key: Optional[str] = None,
+) -> ChatOpenAI:
+    """
+    Shared ChatOpenAI for one (model, temperature, max_tokens) combination.
+
+    base_url points it at another OpenAI-compatible server (e.g. a local vLLM).
+    prompt_cache_key is sent with every request so calls sharing a constant prompt prefix
+    are routed to the same OpenAI prompt cache.
+    """
+    return ChatOpenAI(
+        model=model,
+        api_key=_API_KEY,
+        base_url=base_url,
+        http_async_client=get_http_async_client(),
+        max_tokens=max_tokens,
+        temperature=temperature,
+        model_kwargs={"prompt_cache_key": prompt_cache_key} if prompt_cache_key else {},
+    )
+
+
+@lru_cache(maxsize=None)
+def get_async_openai_client(base_url: Optional[str] = None) -> AsyncOpenAI:
+    """
+    Shared async OpenAI SDK client for direct calls (traced via Langfuse if configured).
+
+    base_url points it at another OpenAI-compatible server (e.g. a local vLLM).
+    """
+    return _TracedAsyncOpenAI(
+        api_key=_API_KEY, base_url=base_url, http_client=get_http_async_client()
+    )
+
+
+@lru_cache(maxsize=None)
+def get_openai_client() -> OpenAI:
+    """Shared sync OpenAI SDK client for offline jobs (Batch API)."""
+    return OpenAI(api_key=_API_KEY)
@@ -1,18 +1,8 @@
-from typing import Dict, TypedDict
+import asyncio
+import os
 
-from langgraph.graph import END, StateGraph
-from pydantic import BaseModel, Field
-
-from story_judge import StoryFeedback, StoryJudge
-from storyteller import StoryTeller
-
-# Optional: Langfuse tracing (simple callback wiring)
-try:
-    from langfuse.langchain import CallbackHandler
-    _LANGFUSE_AVAILABLE = True
-except ImportError:
-    CallbackHandler = None
-    _LANGFUSE_AVAILABLE = False
+# Heavy dependencies (LangChain, LangGraph, OpenAI, Langfuse) are imported inside main()
+# after the first request is typed, so the CLI prompt appears without waiting on them.
 
 """
 Before submitting the assignment, describe here in a few sentences what you would have built next if you spent 2 more hours on this project:
@@ -25,84 +15,11 @@ If I had 2 more hours, I would
 example_requests = "A story about a girl named Alice and her best friend Bob, who happens to be a cat."
 
 
-class StoryState(TypedDict, total=False):
-    user_request: str
-    draft_story: str
-    judge_feedback: StoryFeedback
-    final_story: str
-
-
-class StoryPipelineOutput(BaseModel):
-    user_request: str = Field(..., description="Original request from the user.")
-    initial_story: str = Field(..., description="Story drafted before review.")
-    judge_feedback: StoryFeedback = Field(
-        ..., description="Structured critique from the LLM judge."
-    )
-    final_story: str = Field(
-        ..., description="Story returned to the user after any revisions."
-    )
-    revision_performed: bool = Field(
-        ...,
-        description="Indicates whether a revision was performed based on the judge's scores.",
-    )
-
-
-def build_story_graph(storyteller: StoryTeller, story_judge: StoryJudge):
-    graph = StateGraph(StoryState)
-
-    def generate_story(state: StoryState) -> Dict[str, str]:
-        story = storyteller.tell_story(state["user_request"])
-        return {"draft_story": story}
-
-    def evaluate_story(state: StoryState) -> Dict[str, StoryFeedback]:
-        feedback = story_judge.review(state["user_request"], state["draft_story"])
-        return {"judge_feedback": feedback}
-
-    def apply_feedback(state: StoryState) -> Dict[str, str]:
-        feedback: StoryFeedback = state["judge_feedback"]
-
-        # Decide if a revision is needed purely from scores.
-        needs_revision = not StoryJudge.is_ready(feedback)
-
-        if needs_revision:
-            # Use the judge's edit_instructions directly as the revision plan.
-            revision_notes = feedback.edit_instructions.strip() or (
-                "Revise once to better match a calm, age-appropriate bedtime tone for "
-                "children ages 5–10, with simple language and a soft, cozy ending."
-            )
-            revised_story = storyteller.revise_story(
-                state["user_request"],
-                state["draft_story"],
-                revision_notes,
-            )
-            return {"final_story": revised_story}
-
-        # If no revision needed, pass through the original draft.
-        return {"final_story": state["draft_story"]}
-
-    graph.add_node("generate_story", generate_story)
-    graph.add_node("evaluate_story", evaluate_story)
-    graph.add_node("apply_feedback", apply_feedback)
-
-    graph.set_entry_point("generate_story")
-    graph.add_edge("generate_story", "evaluate_story")
-    graph.add_edge("evaluate_story", "apply_feedback")
-    graph.add_edge("apply_feedback", END)
-
-    return graph.compile()
-
-
-def main():
-    storyteller = StoryTeller()
-    judge = StoryJudge()
-    pipeline = build_story_graph(storyteller, judge)
-
-    # Simple Langfuse tracing: attach a callback handler to the graph invocation if available.
-    langfuse_handler = CallbackHandler() if _LANGFUSE_AVAILABLE else None
-
+async def main():
     print("Type 'exit' or 'quit' to end the conversation.")
     print(f"Example request: {example_requests}\n")
 
+    pipeline = None
     while True:
         user_input = input("You: ").strip()
         if not user_input:
@@ -111,15 +28,63 @@ def main():
             print("Goodbye!")
             break
 
-        invoke_config = {}
+        if pipeline is None:
+            # First request: now pay for the heavy imports and build the components.
+            from langchain_community.cache import SQLiteCache
+            from langchain_core.globals import set_llm_cache
+
+            from story_pipeline import StoryPipelineOutput, build_story_graph
+            from story_judge import DEFAULT_JUDGE_MODEL, StoryFeedback, StoryJudge
+            from storyteller import StoryTeller
+
+            # Persistent LLM cache: identical (model, params, messages) calls are answered
+            # from disk. Set LLM_CACHE_PATH to an empty string to disable it.
+            llm_cache_path = os.getenv("LLM_CACHE_PATH", ".lc_cache.db")
+            if llm_cache_path:
+                set_llm_cache(SQLiteCache(database_path=llm_cache_path))
+
+            storyteller = StoryTeller()
+            # The judge can run on a cheaper model, or a self-hosted OpenAI-compatible server.
+            judge = StoryJudge(
+                model=os.getenv("STORY_JUDGE_MODEL", DEFAULT_JUDGE_MODEL),
+                base_url=os.getenv("STORY_JUDGE_BASE_URL") or None,
+                # Models without json_schema support (e.g. gpt-3.5-turbo) need this set to 0.
+                strict_schema=os.getenv("STORY_JUDGE_STRICT_SCHEMA", "1").lower()
+                not in ("0", "false", "no"),
+                # Reviews cached by story text + rubric; an empty JUDGE_CACHE_PATH disables it.
+                cache_path=os.getenv("JUDGE_CACHE_PATH", ".judge_cache.db") or None,
+            )
+            pipeline = build_story_graph(storyteller, judge)
+
+            # Simple Langfuse tracing: attach a callback handler to the graph invocation if available.
+            try:
+                from langfuse.langchain import CallbackHandler
+                langfuse_handler = CallbackHandler()
+            except ImportError:
+                langfuse_handler = None
+
+        # Stream the final revision to the terminal as it is generated, instead of waiting
+        # for the whole story; the header is printed on the first chunk.
+        streamed = False
+
+        def print_token(token: str) -> None:
+            nonlocal streamed
+            if not streamed:
+                print("\nStoryteller:\n")
+                streamed = True
+            print(token, end="", flush=True)
+
+        invoke_config = {"configurable": {"on_token": print_token}}
         if langfuse_handler is not None:
-            invoke_config = {
-                "callbacks": [langfuse_handler],
-                "tags": ["hippocratic-ai", "story_pipeline"],
-            }
+            invoke_config.update(
+                {
+                    "callbacks": [langfuse_handler],
+                    "tags": ["hippocratic-ai", "story_pipeline"],
+                }
+            )
 
         # Run the LangGraph pipeline.
-        state_result = pipeline.invoke({"user_request": user_input}, config=invoke_config)
+        state_result = await pipeline.ainvoke({"user_request": user_input}, config=invoke_config)
 
         feedback: StoryFeedback = state_result["judge_feedback"]
         final_story = state_result["final_story"]
@@ -135,8 +100,11 @@ def main():
             revision_performed=revision_performed,
         )
 
-        print("\nStoryteller:\n")
-        print(response.final_story)
+        if streamed:
+            print()
+        else:
+            print("\nStoryteller:\n")
+            print(response.final_story)
 
         # Judge view (scores + issues + instructions)
         print("\nJudge Review:")
@@ -163,6 +131,11 @@ def main():
 
         print(f"\nRevision performed: {response.revision_performed}\n")
 
+    if pipeline is not None:
+        from llm_factory import get_http_async_client
+
+        await get_http_async_client().aclose()
+
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
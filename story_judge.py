@@ -1,12 +1,79 @@
-import os
+import asyncio
+import json
+import re
+from functools import lru_cache
 from typing import List, Optional
 
-from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI
 from pydantic import BaseModel, Field, conint
 
-load_dotenv()
+from judge_cache import JudgeCache, content_hash
+from llm_factory import get_async_openai_client
+
+
+# Rubric scoring is classification-shaped; a small, cheap model is enough for the judge.
+DEFAULT_JUDGE_MODEL = "gpt-4o-mini"
+
+# Groups judge calls onto the same OpenAI prompt cache; bump with the rubric.
+PROMPT_CACHE_KEY = "story_judge_v1"
+
+# Words as a reader counts them: punctuation, dashes and stray symbols are not words, and
+# contractions ("don't", "Bob's") count once. Used for the length_fit target (±15%).
+_WORD_RE = re.compile(r"\b\w+(?:['’]\w+)*\b")
+
+
+def count_words(text: str) -> int:
+    """Word count used against the judge's target length."""
+    return len(_WORD_RE.findall(text))
+
+
+# Words the rubric rules out for bedtime stories outright (spooky entities, violence,
+# weaponry, gore, nightmares). A match fails safety without needing the LLM judge.
+_SCARY_WORDS = (
+    r"monsters?", r"ghosts?", r"haunted", r"blood", r"bloody", r"gore", r"gory",
+    r"weapons?", r"guns?", r"knife", r"knives", r"swords?", r"kill(?:s|ed|ing)?",
+    r"murder(?:s|ed)?", r"nightmares?", r"zombies?", r"skeletons?",
+)
+
+# Optional: Hyperscan compiles every pattern into one automaton and scans the story in a
+# single pass; re2 (linear-time, no backtracking) is the next choice, then the stdlib.
+try:
+    import hyperscan
+
+    _SCARY_WORDS_DB = hyperscan.Database()
+    _SCARY_WORDS_DB.compile(
+        expressions=[rf"\b(?:{word})\b".encode() for word in _SCARY_WORDS],
+        ids=list(range(len(_SCARY_WORDS))),
+        flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SOM_LEFTMOST] * len(_SCARY_WORDS),
+    )
+
+    def _find_scary_words(story: str) -> List[str]:
+        """Every banned word occurring in the story, as written."""
+        data = story.encode("utf-8")
+        matches: List[str] = []
+        _SCARY_WORDS_DB.scan(
+            data,
+            match_event_handler=lambda _id, start, end, _flags, _ctx: matches.append(
+                data[start:end].decode("utf-8", "ignore")
+            ),
+        )
+        return matches
+
+except ImportError:
+    try:
+        import re2 as _scan_re
+    except ImportError:
+        _scan_re = re
+
+    # All patterns in one alternation, so the story is still scanned once.
+    _SCARY_WORDS_RE = _scan_re.compile(r"(?i)\b(?:" + "|".join(_SCARY_WORDS) + r")\b")
+
+    def _find_scary_words(story: str) -> List[str]:
+        """Every banned word occurring in the story, as written."""
+        return _SCARY_WORDS_RE.findall(story)
+
+# Drafts further than this from the target length fail length_fit without the LLM judge
+# (the rubric itself asks for ±15%; the gap leaves borderline cases to the judge).
+_QUICK_LENGTH_TOLERANCE = 0.30
 
 
 # ---------------------------
@@ -49,6 +116,36 @@ class StoryFeedback(BaseModel):
     )
 
 
+def _strict_json_schema(schema):
+    """
+    Adapt a pydantic JSON schema to OpenAI's strict Structured Outputs rules: every object
+    lists all of its properties as required, forbids extra keys, and carries no defaults.
+    """
+    if isinstance(schema, list):
+        return [_strict_json_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+
+    strict = {}
+    for key, value in schema.items():
+        if key == "default":
+            continue
+        if key in ("properties", "$defs"):
+            strict[key] = {name: _strict_json_schema(sub) for name, sub in value.items()}
+        else:
+            strict[key] = _strict_json_schema(value)
+    if strict.get("type") == "object" and "properties" in strict:
+        strict["required"] = list(strict["properties"])
+        strict["additionalProperties"] = False
+    return strict
+
+
+@lru_cache(maxsize=1024)
+def _review_key(rubric_hash: str, child_age: int, tone: str, length_target: int) -> str:
+    """Cache key for everything besides the story that a review's verdict depends on."""
+    return content_hash(f"{rubric_hash}|{child_age}|{tone}|{length_target}")
+
+
 # ---------------------------
 # Judge implementation
 # ---------------------------
@@ -60,9 +157,46 @@ class StoryJudge:
         self,
         *,
         max_tokens: int = 600,      # Judge should be concise
-        temperature: float = 0.1,   # Low randomness for consistent gating
-        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.0,   # Deterministic gating
+        model: str = DEFAULT_JUDGE_MODEL,
+        base_url: Optional[str] = None,
+        strict_schema: bool = True,
+        cache_path: Optional[str] = None,
     ):
+        """
+        Args:
+            max_tokens: Maximum tokens for a review.
+            temperature: Sampling temperature for reviews.
+            model: Judge model. Rubric scoring is classification-shaped, so a small model is
+                enough; the storyteller keeps its own (stronger) model.
+            base_url: OpenAI-compatible endpoint (e.g. a local vLLM server) to serve the judge
+                from instead of the OpenAI API.
+            strict_schema: Use strict Structured Outputs (json_schema). Set False for models
+                that only support JSON mode (e.g. gpt-3.5-turbo); the schema then goes in
+                the system prompt instead.
+            cache_path: SQLite file for caching reviews by story text and rubric, so a
+                draft that was already judged is not sent to the LLM again. None disables it.
+        """
+        # JSON schema the judge must fill in; metadata is echoed by the caller, not the model.
+        self._schema = StoryFeedback.model_json_schema()
+        self._schema["properties"].pop("metadata", None)
+        if strict_schema:
+            self._response_format = {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "StoryFeedback",
+                    "schema": _strict_json_schema(self._schema),
+                    "strict": True,
+                },
+            }
+            schema_instruction = "You MUST respond with JSON matching the StoryFeedback schema."
+        else:
+            self._response_format = {"type": "json_object"}
+            schema_instruction = (
+                "You MUST respond with a single JSON object that matches this JSON schema:\n"
+                + json.dumps(self._schema)
+            )
+
         self._system_prompt = (
             "You are a careful children's literature JUDGE for BEDTIME stories (ages 5-10).\n"
             "Evaluate a single story and produce:\n"
@@ -90,20 +224,59 @@ class StoryJudge:
             "specific edit_instructions for ONE revision pass (≤120 words).\n"
             "- If the story IS ready: issues may be empty and edit_instructions may be very brief.\n"
             "\n"
-            "You MUST respond in a form compatible with the StoryFeedback schema provided by the tool."
+            + schema_instruction
         )
 
-        self._llm = ChatOpenAI(
-            model=model,
-            api_key=os.getenv("OPENAI_API_KEY"),
-            max_tokens=max_tokens,
-            temperature=temperature,
+        # Prompt pieces that never change are built once; each review only fills the template.
+        self._system_message = {"role": "system", "content": self._system_prompt}
+        self._review_template = (
+            "Review the following bedtime story REQUEST and DRAFTED STORY.\n"
+            "Assess how well the story fulfills the request and is suitable for ages 5-10.\n"
+            "Apply your rubric, readiness rule, and the output schema you were given.\n\n"
+            "User request: {user_request}\n"
+            "Child age: {child_age}\n"
+            "Tone preset: {tone}\n"
+            "Target length (words): {length_target}\n"
+            "Draft story word count (approx): {word_count}\n\n"
+            "--- DRAFT STORY START ---\n{story}\n--- DRAFT STORY END ---"
         )
 
-        # Ask the model to directly emit a StoryFeedback instance
-        self._structured_llm = self._llm.with_structured_output(StoryFeedback)
+        # Reviews and comparisons go straight through the OpenAI SDK with plain dict messages;
+        # reviews are parsed once into StoryFeedback, with no LangChain layer in between.
+        self._model = model
+        self._max_tokens = max_tokens
+        self._temperature = temperature
+        self._client = get_async_openai_client(base_url)
+        # The system prompt (and schema) is a constant prefix, so OpenAI can serve it from its
+        # prompt cache. Other OpenAI-compatible servers may not accept the parameter.
+        use_prompt_cache = base_url is None
+        self._cache_kwargs = {"prompt_cache_key": PROMPT_CACHE_KEY} if use_prompt_cache else {}
+
+        # Verdicts depend on the story and the rubric (prompt + model), not the request wording.
+        self._cache = JudgeCache(cache_path) if cache_path else None
+        self._rubric_hash = content_hash(f"{model}\n{self._system_prompt}")
 
-    def review(
+        # Pairwise preference for tournament selection: one token, fully deterministic.
+        self._compare_prompt = (
+            "You are a careful children's literature JUDGE for BEDTIME stories (ages 5-10).\n"
+            "You will see one story REQUEST and two candidate stories, A and B.\n"
+            "Prefer the story that better fulfills the request while being age-appropriate, "
+            "safe and gentle, clearly structured, calming at the end, and close to the "
+            "target length.\n"
+            "Answer with exactly one letter: A or B."
+        )
+        self._compare_system_message = {"role": "system", "content": self._compare_prompt}
+        self._compare_template = (
+            "User request: {user_request}\n\n"
+            "--- STORY A START ---\n{story_a}\n--- STORY A END ---\n\n"
+            "--- STORY B START ---\n{story_b}\n--- STORY B END ---\n\n"
+            "Which story is better? Answer A or B."
+        )
+        self._compare_cache_kwargs = (
+            {"prompt_cache_key": f"{PROMPT_CACHE_KEY}_compare"} if use_prompt_cache else {}
+        )
+
+    async def review(
         self,
         user_request: str,
         story: str,
@@ -118,47 +291,215 @@ class StoryJudge:
         Readiness check (caller logic, not enforced in schema):
         - Story is considered ready if all scores >= 4 and there are no serious safety issues.
         """
-        word_count = len(story.split())
+        word_count = count_words(story)
 
-        messages = [
-            SystemMessage(content=self._system_prompt),
-            HumanMessage(
-                content=(
-                    "Review the following bedtime story REQUEST and DRAFTED STORY.\n"
-                    "Assess how well the story fulfills the request and is suitable for ages 5-10.\n"
-                    "Apply your rubric, readiness rule, and the output schema you were given.\n\n"
-                    f"User request: {user_request}\n"
-                    f"Child age: {child_age}\n"
-                    f"Tone preset: {tone}\n"
-                    f"Target length (words): {length_target}\n"
-                    f"Draft story word count (approx): {word_count}\n\n"
-                    f"--- DRAFT STORY START ---\n{story}\n--- DRAFT STORY END ---"
+        # Obvious failures (banned words, far off length) don't need an LLM to confirm.
+        quick_feedback = self._quick_check(
+            story,
+            child_age=child_age,
+            tone=tone,
+            length_target=length_target,
+            word_count=word_count,
+        )
+        if quick_feedback is not None:
+            return quick_feedback
+
+        if self._cache is not None:
+            story_hash = content_hash(story)
+            sys_hash = _review_key(self._rubric_hash, child_age, tone, length_target)
+            cached = self._cache.get(story_hash, sys_hash)
+            if cached is not None:
+                return self._finish_review(
+                    StoryFeedback.model_validate_json(cached),
+                    child_age,
+                    tone,
+                    length_target,
+                    word_count,
                 )
-            ),
-        ]
 
-        try:
-            feedback: StoryFeedback = self._structured_llm.invoke(messages)
-            feedback.metadata = {
-                "age": child_age,
-                "tone": tone,
-                "target_length": length_target,
-                "word_count": word_count,
-            }
-            return feedback
+        messages = self._review_messages(
+            user_request, story, child_age, tone, length_target, word_count
+        )
 
+        try:
+            response = await self._client.chat.completions.create(
+                model=self._model,
+                messages=messages,
+                max_tokens=self._max_tokens,
+                temperature=self._temperature,
+                response_format=self._response_format,
+                **self._cache_kwargs,
+            )
+            result = StoryFeedback.model_validate_json(response.choices[0].message.content)
         except Exception as e:
+            result = e
+        else:
+            # Only real LLM verdicts are cached; fallbacks must be retried next time.
+            if self._cache is not None:
+                self._cache.put(story_hash, sys_hash, result.model_dump_json())
+        return self._finish_review(result, child_age, tone, length_target, word_count)
+
+    async def review_many(
+        self,
+        user_request: str,
+        stories: List[str],
+        *,
+        child_age: int = 7,
+        tone: str = "soothing",
+        length_target: int = 500,
+        max_concurrency: int = 8,
+    ) -> List[StoryFeedback]:
+        """
+        Evaluate several candidate stories for the same request in one concurrent batch.
+
+        Same contract as review(), one StoryFeedback per story (in order); a failed call
+        only turns its own entry into the fallback feedback. At most max_concurrency
+        reviews are in flight at once.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def review_one(story: str) -> StoryFeedback:
+            async with semaphore:
+                return await self.review(
+                    user_request,
+                    story,
+                    child_age=child_age,
+                    tone=tone,
+                    length_target=length_target,
+                )
+
+        return list(await asyncio.gather(*(review_one(story) for story in stories)))
+
+    def _review_messages(
+        self,
+        user_request: str,
+        story: str,
+        child_age: int,
+        tone: str,
+        length_target: int,
+        word_count: int,
+    ) -> list:
+        """OpenAI chat messages for a single rubric review."""
+        return [
+            self._system_message,
+            {
+                "role": "user",
+                "content": self._review_template.format(
+                    user_request=user_request,
+                    child_age=child_age,
+                    tone=tone,
+                    length_target=length_target,
+                    word_count=word_count,
+                    story=story,
+                ),
+            },
+        ]
+
+    def _finish_review(
+        self,
+        result,
+        child_age: int,
+        tone: str,
+        length_target: int,
+        word_count: int,
+    ) -> StoryFeedback:
+        """Attach metadata to a judge result, or build the fallback if the call failed."""
+        if isinstance(result, Exception):
             return self._fallback_feedback(
-                error=str(e),
+                error=str(result),
                 child_age=child_age,
                 tone=tone,
                 length_target=length_target,
                 word_count=word_count,
             )
+        result.metadata = {
+            "age": child_age,
+            "tone": tone,
+            "target_length": length_target,
+            "word_count": word_count,
+        }
+        return result
+
+    async def compare(self, user_request: str, story_a: str, story_b: str) -> int:
+        """
+        Pairwise preference between two candidate stories.
+
+        Returns 0 if story_a is preferred and 1 if story_b is preferred. Falls back to
+        story_a if the call fails or the answer cannot be parsed.
+        """
+        messages = [
+            self._compare_system_message,
+            {
+                "role": "user",
+                "content": self._compare_template.format(
+                    user_request=user_request, story_a=story_a, story_b=story_b
+                ),
+            },
+        ]
+        try:
+            response = await self._client.chat.completions.create(
+                model=self._model,
+                messages=messages,
+                max_tokens=1,
+                temperature=0,
+                **self._compare_cache_kwargs,
+            )
+            answer = response.choices[0].message.content or ""
+        except Exception:
+            return 0
+        return 1 if answer.strip().upper().startswith("B") else 0
+
+    async def select_best(
+        self,
+        user_request: str,
+        stories: List[str],
+        *,
+        comparisons_per_pair: int = 1,
+    ) -> int:
+        """
+        Knockout tournament over candidate stories; returns the index of the winner.
+
+        Each round pairs up the remaining candidates (an odd one out gets a bye) and
+        runs every comparison of the round concurrently. Within a pair, the comparisons
+        alternate the A/B order to offset position bias; ties go to the earlier candidate.
+        """
+        contenders = list(range(len(stories)))
+        while len(contenders) > 1:
+            pairs = list(zip(contenders[0::2], contenders[1::2]))
+            byes = contenders[len(pairs) * 2:]
+
+            votes = await asyncio.gather(
+                *(
+                    self._vote(user_request, stories, a, b, swap=k % 2 == 1)
+                    for a, b in pairs
+                    for k in range(comparisons_per_pair)
+                )
+            )
+
+            winners = []
+            for p, (a, b) in enumerate(pairs):
+                pair_votes = votes[p * comparisons_per_pair:(p + 1) * comparisons_per_pair]
+                winners.append(a if pair_votes.count(a) >= pair_votes.count(b) else b)
+            contenders = winners + byes
+
+        return contenders[0]
+
+    async def _vote(
+        self, user_request: str, stories: List[str], a: int, b: int, *, swap: bool
+    ) -> int:
+        """One pairwise comparison between stories[a] and stories[b]; returns the winner's index."""
+        if swap:
+            return (b, a)[await self.compare(user_request, stories[b], stories[a])]
+        return (a, b)[await self.compare(user_request, stories[a], stories[b])]
 
     @staticmethod
     def is_ready(feedback: StoryFeedback, threshold: int = 4) -> bool:
         """Compute 'ready' purely from scores (no separate passed flag)."""
+        return StoryJudge.weakest_score(feedback) >= threshold
+
+    @staticmethod
+    def weakest_score(feedback: StoryFeedback) -> int:
+        """Lowest rubric score; readiness and candidate ranking both hinge on it."""
         s = feedback.scores
         return min(
             s.age_fit,
@@ -167,7 +508,7 @@ class StoryJudge:
             s.tone_bedtime,
             s.engagement_creativity,
             s.length_fit,
-        ) >= threshold
+        )
 
     @staticmethod
     def _fallback_feedback(
@@ -206,3 +547,65 @@ class StoryJudge:
                 "word_count": word_count,
             },
         )
+
+    @staticmethod
+    def _quick_check(
+        story: str,
+        *,
+        child_age: int,
+        tone: str,
+        length_target: int,
+        word_count: int,
+    ) -> Optional[StoryFeedback]:
+        """
+        Cheap pre-judge filter for drafts that clearly fail.
+
+        Returns a synthetic StoryFeedback forcing a revision when the story contains a
+        banned scary word or is more than 30% off the target length; returns None when
+        the draft needs the real LLM review. Dimensions it cannot assess are scored 3.
+        """
+        scary_words = sorted({m.lower() for m in _find_scary_words(story)})
+        length_off = (
+            length_target > 0
+            and abs(word_count - length_target) / length_target > _QUICK_LENGTH_TOLERANCE
+        )
+        if not scary_words and not length_off:
+            return None
+
+        issues = [f"scary_word:{word}" for word in scary_words]
+        instructions = []
+        if scary_words:
+            instructions.append(
+                f"Remove or gently replace the scary elements ({', '.join(scary_words)}) "
+                "with calm, friendly ones."
+            )
+        if length_off:
+            issues.append(f"length_off:{word_count}/{length_target}")
+            instructions.append(
+                f"Rewrite to about {length_target} words (currently {word_count})."
+            )
+        instructions.append(
+            "Keep the characters and plot, simple vocabulary, short sentences, and end "
+            "with a calm, cozy paragraph."
+        )
+
+        scores = Scores(
+            age_fit=3,
+            safety_sensitivity=1 if scary_words else 3,
+            clarity_structure=3,
+            tone_bedtime=3,
+            engagement_creativity=3,
+            length_fit=1 if length_off else 3,
+        )
+        return StoryFeedback(
+            scores=scores,
+            issues=issues,
+            edit_instructions=" ".join(instructions),
+            metadata={
+                "age": child_age,
+                "tone": tone,
+                "target_length": length_target,
+                "word_count": word_count,
+                "quick_check": True,
+            },
+        )
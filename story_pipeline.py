@@ -0,0 +1,212 @@
+import asyncio
+from typing import Callable, Dict, List, Optional, TypedDict
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph import END, StateGraph
+from pydantic import BaseModel, Field
+
+from story_judge import StoryFeedback, StoryJudge
+from storyteller import StoryTeller
+
+# Generic revision plan used for the speculative revision that runs alongside the judge
+# (and as a fallback when the judge returns no edit_instructions).
+DEFAULT_REVISION_NOTES = (
+    "Revise once to better match a calm, age-appropriate bedtime tone for "
+    "children ages 5–10, with simple language and a soft, cozy ending."
+)
+
+# Parallel drafting + knockout tournament: how many candidate drafts to sample (in one
+# request), at what temperature, and how many pairwise judge comparisons decide each match-up.
+NUM_DRAFTS = 3
+DRAFT_TEMPERATURE = 0.7
+COMPARISONS_PER_PAIR = 1
+
+
+class StoryState(TypedDict, total=False):
+    user_request: str
+    candidate_stories: List[str]
+    draft_story: str
+    judge_feedback: StoryFeedback
+    final_story: str
+
+
+class StoryPipelineOutput(BaseModel):
+    user_request: str = Field(..., description="Original request from the user.")
+    initial_story: str = Field(..., description="Story drafted before review.")
+    judge_feedback: StoryFeedback = Field(
+        ..., description="Structured critique from the LLM judge."
+    )
+    final_story: str = Field(
+        ..., description="Story returned to the user after any revisions."
+    )
+    revision_performed: bool = Field(
+        ...,
+        description="Indicates whether a revision was performed based on the judge's scores.",
+    )
+
+
+class _HeldTokens:
+    """
+    on_token wrapper for a speculative revision: chunks are buffered until release(), then
+    flushed in one piece and passed straight through, so a discarded revision never shows.
+    """
+
+    def __init__(self, on_token: Callable[[str], None]):
+        self._on_token = on_token
+        self._pending: List[str] = []
+        self._released = False
+
+    def __call__(self, token: str) -> None:
+        if self._released:
+            self._on_token(token)
+        else:
+            self._pending.append(token)
+
+    def release(self) -> None:
+        self._released = True
+        if self._pending:
+            self._on_token("".join(self._pending))
+            self._pending = []
+
+
+def _discard(task: asyncio.Task) -> None:
+    """Cancel a speculative task without leaving an unretrieved exception behind."""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+def _on_token(
+    config: RunnableConfig, key: str = "on_token"
+) -> Optional[Callable[[str], None]]:
+    """
+    Optional streaming callback from config["configurable"]: "on_token" receives the final
+    revision's text as it streams in, "on_draft_token" a single draft's (num_drafts=1).
+    """
+    return config.get("configurable", {}).get(key)
+
+
+def build_story_graph(
+    storyteller: StoryTeller,
+    story_judge: StoryJudge,
+    *,
+    num_drafts: int = NUM_DRAFTS,
+    draft_temperature: float = DRAFT_TEMPERATURE,
+    comparisons_per_pair: int = COMPARISONS_PER_PAIR,
+):
+    graph = StateGraph(StoryState)
+
+    async def generate_story(state: StoryState, config: RunnableConfig) -> Dict[str, List[str]]:
+        if num_drafts == 1:
+            # No tournament: draft at the storyteller's own temperature, streamed if asked.
+            story = await storyteller.tell_story(
+                state["user_request"], on_token=_on_token(config, "on_draft_token")
+            )
+            return {"candidate_stories": [story]}
+
+        # One request with n choices: the prompt is prefilled once for all candidates.
+        candidates = await storyteller.tell_story_multi(
+            state["user_request"], num_drafts, temperature=draft_temperature
+        )
+        return {"candidate_stories": candidates}
+
+    async def revise_with_speculation(
+        user_request: str,
+        draft_story: str,
+        judge_task: asyncio.Task,
+        on_token: Optional[Callable[[str], None]],
+    ) -> Dict[str, object]:
+        """
+        Wait for the judge's verdict on draft_story while a generic revision runs beside it,
+        so that in the (common) revision path the judge latency is hidden behind it.
+        """
+        held_tokens = _HeldTokens(on_token) if on_token else None
+        revision_task = asyncio.create_task(
+            storyteller.revise_story(
+                user_request,
+                draft_story,
+                DEFAULT_REVISION_NOTES,
+                record_history=False,
+                on_token=held_tokens,
+            )
+        )
+
+        try:
+            feedback = await judge_task
+        except BaseException:
+            _discard(revision_task)
+            raise
+
+        # Decide if a revision is needed purely from scores.
+        if StoryJudge.is_ready(feedback):
+            _discard(revision_task)
+            return {"judge_feedback": feedback, "final_story": draft_story}
+
+        # Not ready: keep the speculative revision, which is already under way. Its text
+        # starts showing now (whatever has streamed so far, then the rest as it arrives).
+        if held_tokens is not None:
+            held_tokens.release()
+        revised_story = await revision_task
+        storyteller.record_revision(revised_story)
+        return {"judge_feedback": feedback, "final_story": revised_story}
+
+    async def select_story(state: StoryState) -> Dict[str, object]:
+        user_request = state["user_request"]
+        candidates = state["candidate_stories"]
+        if len(candidates) == 1:
+            # tell_story() already recorded a single draft; a server that ignored `n` did not.
+            if num_drafts > 1:
+                storyteller.record_turn(user_request, candidates[0])
+            return {"draft_story": candidates[0]}
+
+        # Review every candidate in one concurrent batch first; only the drafts tied on the
+        # best weakest score go into the bracket, so candidates the rubric (or the quick
+        # pre-check) already failed cannot win, and a clear leader skips it altogether.
+        reviews = await story_judge.review_many(user_request, candidates)
+        weakest = [StoryJudge.weakest_score(review) for review in reviews]
+        finalists = [i for i, score in enumerate(weakest) if score == max(weakest)]
+        winner = finalists[0]
+        if len(finalists) > 1:
+            winner = finalists[
+                await story_judge.select_best(
+                    user_request,
+                    [candidates[i] for i in finalists],
+                    comparisons_per_pair=comparisons_per_pair,
+                )
+            ]
+
+        # Only the winning draft becomes part of the conversation history.
+        storyteller.record_turn(user_request, candidates[winner])
+        return {"draft_story": candidates[winner], "judge_feedback": reviews[winner]}
+
+    async def review_story(state: StoryState, config: RunnableConfig) -> Dict[str, object]:
+        user_request = state["user_request"]
+        draft_story = state["draft_story"]
+        on_token = _on_token(config)
+
+        feedback = state.get("judge_feedback")
+        if feedback is not None:
+            # Already reviewed during selection: decide straight from its scores.
+            if StoryJudge.is_ready(feedback):
+                return {"final_story": draft_story}
+            revised_story = await storyteller.revise_story(
+                user_request,
+                draft_story,
+                feedback.edit_instructions.strip() or DEFAULT_REVISION_NOTES,
+                on_token=on_token,
+            )
+            return {"final_story": revised_story}
+
+        # Single draft: nothing has judged it yet.
+        judge_task = asyncio.create_task(story_judge.review(user_request, draft_story))
+        return await revise_with_speculation(user_request, draft_story, judge_task, on_token)
+
+    graph.add_node("generate_story", generate_story)
+    graph.add_node("select_story", select_story)
+    graph.add_node("review_story", review_story)
+
+    graph.set_entry_point("generate_story")
+    graph.add_edge("generate_story", "select_story")
+    graph.add_edge("select_story", "review_story")
+    graph.add_edge("review_story", END)
+
+    return graph.compile()
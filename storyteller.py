@@ -1,11 +1,37 @@
-import os
+from typing import Callable, List, Optional, Tuple
 
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_core.caches import BaseCache
+from langchain_core.globals import get_llm_cache
+from langchain_core.language_models import BaseChatModel
+from langchain_core.load import dumps
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration
+from langchain_core.runnables import ensure_config
 
-load_dotenv()
+from chat_memory import SummaryBufferHistory
+from llm_factory import get_chat
+
+# What a revision turn looks like from the user side once it is stored in history.
+REVISION_TURN = "(revision requested)"
+
+# Groups story calls onto the same OpenAI prompt cache (they all start with the system prompt).
+PROMPT_CACHE_KEY = "storyteller_v1"
+
+
+def _cache_entry(llm: BaseChatModel, messages: list) -> Tuple[Optional[BaseCache], str, str]:
+    """
+    The LLM cache ainvoke() would use for messages, with its (prompt, llm_string) key.
+
+    Mirrors BaseChatModel's own lookup (a per-instance cache, else the global one; False
+    disables it) and relies on its private key format, so that dependency lives only here.
+    Returns (None, "", "") when caching is off.
+    """
+    if llm.cache is False:
+        return None, "", ""
+    llm_cache = llm.cache if isinstance(llm.cache, BaseCache) else get_llm_cache()
+    if llm_cache is None:
+        return None, "", ""
+    return llm_cache, dumps(messages), llm._get_llm_string()
 
 
 class StoryTeller:
@@ -14,6 +40,8 @@ class StoryTeller:
         system_prompt_path: str = "system_prompt.txt",
         max_tokens: int = 3000,
         temperature: float = 0.1,
+        max_history_tokens: int = 1500,
+        history_window_turns: int = 2,
     ):
         """
         Initialize the StoryTeller with a system prompt from a file.
@@ -22,18 +50,26 @@ class StoryTeller:
             system_prompt_path: Path to the system prompt text file.
             max_tokens: Maximum tokens for the LLM response.
             temperature: Temperature setting for the LLM.
+            max_history_tokens: Token budget for history before older turns are summarized.
+            history_window_turns: Number of most recent requests (with their revisions) always
+                kept verbatim.
         """
         self.max_tokens = max_tokens
         self.temperature = temperature
         self.system_prompt = self._load_system_prompt(system_prompt_path)
-        self.llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            api_key=os.getenv("OPENAI_API_KEY"),
-            max_tokens=max_tokens,
-            temperature=temperature,
+        # Built once so every request starts with the byte-identical, cacheable prefix.
+        self._system_message = SystemMessage(content=self.system_prompt)
+        self.llm = get_chat(
+            "gpt-3.5-turbo", temperature, max_tokens, prompt_cache_key=PROMPT_CACHE_KEY
+        )
+        # Keep message history between calls, as requested, but bounded: older turns are
+        # folded into a summary by a cheap call once the token budget is exceeded.
+        self.history = SummaryBufferHistory(
+            get_chat("gpt-3.5-turbo", 0, 300),
+            max_history_tokens=max_history_tokens,
+            window_turns=history_window_turns,
+            follow_up_messages=(REVISION_TURN,),
         )
-        # Keep message history between calls, as requested.
-        self.history = InMemoryChatMessageHistory()
 
     def _load_system_prompt(self, file_path: str) -> str:
         """Load the system prompt from a text file."""
@@ -43,28 +79,116 @@ class StoryTeller:
         except FileNotFoundError:
             raise FileNotFoundError(f"System prompt file not found: {file_path}")
 
-    def tell_story(self, user_request: str) -> str:
+    async def tell_story(
+        self,
+        user_request: str,
+        *,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
         """
         Generate a story based on the user's request.
 
         Args:
             user_request: The user's story request.
+            on_token: If given, the response is streamed and each text chunk is passed
+                to it as it arrives (e.g. to print incrementally).
 
         Returns:
             The generated story.
         """
-        messages = [
-            SystemMessage(content=self.system_prompt),
+        messages = self._build_messages(user_request)
+        story = await self._complete(messages, on_token)
+        # Persist this interaction in history for future turns.
+        self.record_turn(user_request, story)
+        return story
+
+    async def tell_story_multi(
+        self, user_request: str, n: int, *, temperature: Optional[float] = None
+    ) -> List[str]:
+        """
+        Generate n candidate stories from a single request using OpenAI's `n` sampling.
+
+        The prompt is sent and prefilled once and only one request counts against the
+        rate limit. Nothing is written to history; the caller records the chosen
+        candidate with record_turn().
+
+        Args:
+            user_request: The user's story request.
+            n: Number of completions to sample.
+            temperature: Sampling temperature for this call (defaults to self.temperature).
+
+        Returns:
+            One story per returned choice.
+        """
+        messages = self._build_messages(user_request)
+        overrides = {"n": n}
+        if temperature is not None:
+            overrides["temperature"] = temperature
+        # ainvoke() only surfaces the first choice, so go through agenerate() and
+        # forward the ambient run config to keep tracing callbacks attached.
+        config = ensure_config()
+        result = await self.llm.agenerate(
+            [messages],
+            callbacks=config.get("callbacks"),
+            tags=config.get("tags"),
+            metadata=config.get("metadata"),
+            **overrides,
+        )
+        return [generation.message.content for generation in result.generations[0]]
+
+    def record_turn(self, user_message: str, ai_message: str) -> None:
+        """Persist one user/assistant exchange in history for future turns."""
+        self.history.add_user_message(user_message)
+        self.history.add_ai_message(ai_message)
+        # Summarize older turns in the background, not in front of the next request.
+        self.history.schedule_compaction()
+
+    async def _complete(
+        self, messages: list, on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """Run the LLM on messages, streaming chunks to on_token when one is given."""
+        if on_token is None:
+            response = await self.llm.ainvoke(messages)
+            return response.content
+
+        # astream() bypasses the LLM cache. On a hit, ainvoke() serves the story from the
+        # cache (with the usual callbacks) and it is replayed to on_token in one piece.
+        llm_cache, prompt, llm_string = _cache_entry(self.llm, messages)
+        if llm_cache is not None and await llm_cache.alookup(prompt, llm_string):
+            response = await self.llm.ainvoke(messages)
+            on_token(response.content)
+            return response.content
+
+        pieces = []
+        async for chunk in self.llm.astream(messages):
+            if chunk.content:
+                on_token(chunk.content)
+                pieces.append(chunk.content)
+        story = "".join(pieces)
+
+        if llm_cache is not None:
+            await llm_cache.aupdate(
+                prompt, llm_string, [ChatGeneration(message=AIMessage(content=story))]
+            )
+        return story
+
+    def _build_messages(self, human_content: str) -> list:
+        """System prompt, (summarized) prior turns, then the new human message."""
+        return [
+            self._system_message,
             *self.history.messages,
-            HumanMessage(content=user_request),
+            HumanMessage(content=human_content),
         ]
-        response = self.llm.invoke(messages)
-        # Persist this interaction in history for future turns.
-        self.history.add_user_message(user_request)
-        self.history.add_ai_message(response.content)
-        return response.content
 
-    def revise_story(self, user_request: str, draft_story: str, feedback: str) -> str:
+    async def revise_story(
+        self,
+        user_request: str,
+        draft_story: str,
+        feedback: str,
+        *,
+        record_history: bool = True,
+        on_token: Optional[Callable[[str], None]] = None,
+    ) -> str:
         """
         Revise an existing story using feedback from a judge.
 
@@ -72,11 +196,34 @@ class StoryTeller:
             user_request: The original user request for context.
             draft_story: The story that was previously generated.
             feedback: Feedback describing what should be adjusted (typically edit_instructions).
+            record_history: Whether to persist this revision turn in history. Speculative
+                revisions pass False and call record_revision() only if they are kept.
+            on_token: If given, the response is streamed and each text chunk is passed
+                to it as it arrives.
 
         Returns:
             The revised story content.
         """
-        revision_prompt = (
+        revision_prompt = self._revision_prompt(user_request, draft_story, feedback)
+        messages = self._build_messages(revision_prompt)
+        revised_story = await self._complete(messages, on_token)
+        if record_history:
+            self.record_revision(revised_story)
+        return revised_story
+
+    def record_revision(self, revised_story: str) -> None:
+        """
+        Persist a revision turn in history.
+
+        Only a short placeholder is stored for the user side: the templated revision
+        prompt embeds the whole draft, which is already in history from the drafting turn.
+        """
+        self.record_turn(REVISION_TURN, revised_story)
+
+    @staticmethod
+    def _revision_prompt(user_request: str, draft_story: str, feedback: str) -> str:
+        """Build the templated prompt used for a single revision pass."""
+        return (
             "You previously drafted a bedtime story. Refine it based on the provided "
             "feedback while keeping the original request in mind. The story must stay "
             "age-appropriate, comforting, and engaging for children ages 5-10. "
@@ -87,13 +234,3 @@ class StoryTeller:
             f"Feedback to apply:\n{feedback}\n\n"
             "Provide the improved story only."
         )
-        messages = [
-            SystemMessage(content=self.system_prompt),
-            *self.history.messages,
-            HumanMessage(content=revision_prompt),
-        ]
-        response = self.llm.invoke(messages)
-        # Persist this revision turn in history as well.
-        self.history.add_user_message(revision_prompt)
-        self.history.add_ai_message(response.content)
-        return response.content